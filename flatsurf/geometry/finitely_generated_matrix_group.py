@@ -23,8 +23,8 @@ EXAMPLES::
     sage: it = iter(G)
     sage: [next(it) for _ in range(5)]
     [
-    [1 0]  [1 1]  [1 2]  [2 1]  [ 0  1]
-    [0 1], [0 1], [0 1], [1 1], [-1  1]
+    [1 0]  [1 1]  [ 1 -1]  [1 0]  [ 1  0]
+    [0 1], [0 1], [ 0  1], [1 1], [-1  1]
     ]
 
     sage: G = FinitelyGenerated2x2MatrixGroup([identity_matrix(2)])
@@ -42,12 +42,22 @@ EXAMPLES::
 from __future__ import absolute_import, print_function, division
 from six.moves import range, map, filter, zip
 
+from collections import deque
+from itertools import combinations, islice
+
 from sage.rings.integer import Integer
+from sage.rings.integer_ring import ZZ
+from sage.rings.rational_field import QQ
 from sage.structure.parent import Parent
 from sage.groups.group import Group
 from sage.structure.sequence import Sequence
 from sage.rings.infinity import Infinity
+from sage.arith.all import gcd
 from sage.matrix.constructor import matrix
+from sage.matrix.matrix_space import MatrixSpace
+from sage.matrix.special import identity_matrix
+from sage.categories.groups import Groups
+from sage.misc.cachefunc import cached_method
 
 
 def invariant_quadratic_forms(m):
@@ -118,14 +128,56 @@ def invariant_quadratic_forms(m):
     if not s.is_unit():
         raise ValueError("determinant must be +1 or -1")
     a,b,c,d = m.list()
-    V = matrix(m.base_ring(), 4, 3,
-              [a-s*d,     0, (1+s)*c,
-                 s*b,     c,  (1-s)*a,
-                   b,   s*c,  (1-s)*d,
-                   0,   d-s*a, (1+s)*b]
+    sa, sb, sc, sd = s*a, s*b, s*c, s*d
+    sp, sm = 1+s, 1-s
+    R = m.base_ring()
+    if R is ZZ or R is QQ:
+        # in the generic case the system has rank two and its kernel is
+        # spanned by the cross product of two independent rows
+        v = _rank_two_kernel([(a-sd, 0, sp*c),
+                              (sb, c, sm*a),
+                              (b, sc, sm*d),
+                              (0, d-sa, sp*b)])
+        if v is not None:
+            if R is ZZ:
+                g = gcd(v)
+                v = [x // g for x in v]
+            return (R**3).submodule([v])
+
+    V = matrix(R, 4, 3,
+              [a-sd,     0, sp*c,
+                 sb,     c, sm*a,
+                  b,    sc, sm*d,
+                  0,  d-sa, sp*b]
               ).right_kernel()
     return V
 
+def _rank_two_kernel(rows):
+    r"""
+    Return a non-zero vector in the kernel of the matrix with the given rows
+    of length 3 if this matrix has rank two and ``None`` otherwise.
+
+    TESTS::
+
+        sage: from flatsurf.geometry.finitely_generated_matrix_group import _rank_two_kernel
+        sage: _rank_two_kernel([(0,0,0), (1,0,0), (1,0,0), (0,0,2)])
+        (0, -2, 0)
+        sage: _rank_two_kernel([(1,0,0), (2,0,0)]) is None
+        True
+        sage: _rank_two_kernel([(1,0,0), (0,1,0), (0,0,1)]) is None
+        True
+    """
+    for i in range(len(rows)):
+        x1, y1, z1 = rows[i]
+        for j in range(i+1, len(rows)):
+            x2, y2, z2 = rows[j]
+            v = (y1*z2 - z1*y2, z1*x2 - x1*z2, x1*y2 - y1*x2)
+            if any(v):
+                if all(x*v[0] + y*v[1] + z*v[2] == 0 for x, y, z in rows):
+                    return v
+                return None
+    return None
+
 def contains_definite_form(V):
     r"""
     Check whether a given a subspace of the 3 dimensional space (a,b,c) contains
@@ -154,27 +206,71 @@ def contains_definite_form(V):
         return False
     elif dim == 1:
         a,c,b = V.gen(0)
-        return b**2 < a*c
+        return b*b < a*c
     elif dim == 2:
         a1,c1,b1 = V.gen(0)
         a2,c2,b2 = V.gen(1)
-        if b1**2 < a1*c1 or b2**2 < a2*c2:
+        D1 = b1*b1 - a1*c1
+        D2 = b2*b2 - a2*c2
+        if D1 < 0 or D2 < 0:
             return True
-        return (2*b1*b2 - a2*c1 - a1*c2)**2 - 4 * (b1**2 - a1*c1) * (b2**2 - a2*c2) > 0
+        X = 2*b1*b2 - a2*c1 - a1*c2
+        return X*X > 4*D1*D2
     elif dim == 3:
         return True
     else:
         raise RuntimeError
 
+# order of the matrices of finite order in GL(2, QQ) indexed by (det, trace)
+_RATIONAL_MATRIX_ORDERS = {
+    (1, -1): Integer(3),
+    (1, 0): Integer(4),
+    (1, 1): Integer(6),
+    (-1, 0): Integer(2)}
+
 def matrix_multiplicative_order(m):
     r"""
     Return the order of the 2x2 matrix ``m``.
+
+    EXAMPLES::
+
+        sage: from flatsurf.geometry.finitely_generated_matrix_group import matrix_multiplicative_order
+
+        sage: matrix_multiplicative_order(identity_matrix(2))
+        1
+        sage: matrix_multiplicative_order(-identity_matrix(2))
+        2
+        sage: matrix_multiplicative_order(matrix(2, [0,1,1,0]))
+        2
+        sage: matrix_multiplicative_order(matrix(2, [0,-1,1,-1]))
+        3
+        sage: matrix_multiplicative_order(matrix(2, [0,-1,1,0]))
+        4
+        sage: matrix_multiplicative_order(matrix(QQ, 2, [1,-1,1,0]))
+        6
+        sage: matrix_multiplicative_order(matrix(2, [1,1,0,1]))
+        +Infinity
+        sage: matrix_multiplicative_order(matrix(2, [2,1,1,1]))
+        +Infinity
+        sage: matrix_multiplicative_order(matrix(QQ, 2, [1/2,0,0,2]))
+        +Infinity
     """
     if m.is_one():
         return Integer(1)
-    elif m.det() != 1 and m.det() != -1:
+    det = m.det()
+    if det != 1 and det != -1:
         return Infinity
 
+    if m.base_ring() is ZZ or m.base_ring() is QQ:
+        # the eigenvalues of a rational matrix of finite order are roots of
+        # unity, so its characteristic polynomial is integral and the order
+        # only depends on the determinant and the trace (except for the
+        # scalar and parabolic matrices of trace +2 or -2)
+        tr = m.trace()
+        if tr == -2 and det == 1:
+            return Integer(2) if m.is_scalar() else Infinity
+        return _RATIONAL_MATRIX_ORDERS.get((det, tr), Infinity)
+
     # now we compute the potentially preserved quadratic form
     # i.e. looking for A such that m^t A m = A
     m00 = m[0,0]
@@ -203,24 +299,41 @@ def matrix_multiplicative_order(m):
 class FinitelyGenerated2x2MatrixGroup(Group):
     r"""
     Finitely generated group of 2x2 matrices with real coefficients
+
+    The generators are made immutable and the group is considered immutable
+    as well. In particular, it can be used as a key in dictionaries.
+
+    EXAMPLES::
+
+        sage: from flatsurf.geometry.finitely_generated_matrix_group import FinitelyGenerated2x2MatrixGroup
+        sage: m1 = matrix([[1,1],[0,1]])
+        sage: m2 = matrix([[1,0],[1,1]])
+        sage: G = FinitelyGenerated2x2MatrixGroup([m1,m2])
+        sage: hash(G) == hash(FinitelyGenerated2x2MatrixGroup([m1,m2]))
+        True
+        sage: d = {G: 1}
+        sage: d[FinitelyGenerated2x2MatrixGroup([m1,m2])]
+        1
     """
     def __init__(self, matrices, matrix_space=None, category=None):
         if matrix_space is None:
-            from sage.matrix.matrix_space import MatrixSpace
             ring = Sequence(matrices).universe().base_ring()
             matrix_space = MatrixSpace(ring,2)
 
-        self._generators = list(map(matrix_space,matrices))
+        self._generators = tuple(map(matrix_space,matrices))
         for m in self._generators:
             m.set_immutable()
         self._matrix_space = matrix_space
+        self._one = matrix_space.identity_matrix()
+        self._one.set_immutable()
+        self._fingerprint = tuple(tuple(m.list()) for m in self._generators)
 
         if category is None:
-            from sage.categories.groups import Groups
             category = Groups()
 
         Parent.__init__(self, category=category, facade=matrix_space)
 
+    @cached_method
     def is_abelian(self):
         r"""
         Check whether this group is abelian.
@@ -243,18 +356,16 @@ class FinitelyGenerated2x2MatrixGroup(Group):
             sage: G.is_abelian()
             True
         """
-        for a in self._generators:
-            for b in self._generators:
-                if a*b != b*a:
-                    return False
-        return True
+        return all(a*b == b*a for a, b in combinations(self._generators, 2))
 
+    @cached_method
     def _repr_(self):
         mat_string = [g.str().split('\n') for g in self._generators]
         return ("Matrix group generated by:\n" +
                 "  ".join(x[0] for x in mat_string) + "\n" +
                 ", ".join(x[1] for x in mat_string))
 
+    @cached_method
     def is_finite(self):
         r"""
         Check whether the group is finite.
@@ -284,6 +395,11 @@ class FinitelyGenerated2x2MatrixGroup(Group):
             sage: FinitelyGenerated2x2MatrixGroup([t*m1*~t,t*m2*~t]).is_finite()
             False
 
+            sage: FinitelyGenerated2x2MatrixGroup([matrix([[1,1],[1,0]])]).is_finite()
+            False
+            sage: FinitelyGenerated2x2MatrixGroup([matrix(QQ, [[0,-1],[1,1/2]])]).is_finite()
+            False
+
             sage: from flatsurf.geometry.polygon import number_field_elements_from_algebraics
             sage: c5 = QQbar.zeta(5).real()
             sage: s5 = QQbar.zeta(5).imag()
@@ -300,67 +416,217 @@ class FinitelyGenerated2x2MatrixGroup(Group):
         """
         # determinant and trace tests
         # (the code actually check that each generator is of finite order)
+        # (we also collect the non-scalar generators in the same pass, the
+        # ones of determinant 1 first since they have a rank one space of
+        # invariant forms)
+        # (over ZZ and QQ the order of a non-scalar generator is determined
+        # by its determinant and trace, see matrix_multiplicative_order)
+        R = self._matrix_space.base_ring()
+        rational = R is ZZ or R is QQ
+        gens = []
+        reflections = []
         for m in self._generators:
-            if (m.det() != 1 and m.det() != -1) or \
-               m.trace().abs() > 2 or \
-               (m.trace().abs() == 2 and (m[0,1] or m[1,0])):
-                   return False
-
-        gens = [g for g in self._generators if not g.is_scalar()]
+            a, b, c, d = m.list()
+            det = a*d - b*c
+            if det != 1 and det != -1:
+                return False
+            tr = (a + d).abs()
+            if tr > 2 or (tr == 2 and (b or c)):
+                return False
+            if b or c or a != d:
+                if rational and (det, a + d) not in _RATIONAL_MATRIX_ORDERS:
+                    return False
+                if det == 1:
+                    gens.append(m)
+                else:
+                    reflections.append(m)
+        gens.extend(reflections)
 
         if len(gens) <= 1:
             return True
 
         # now we try to find a non-trivial invariant quadratic form
-        from sage.modules.free_module import FreeModule
-        V = FreeModule(self._matrix_space.base_ring(), 3)
-        for g in gens:
-            V = V.intersection(invariant_quadratic_forms(g))
+        V = invariant_quadratic_forms(gens[0])
+        if not contains_definite_form(V):
+            return False
+        for i in range(1, len(gens)):
+            if V.dimension() == 1:
+                # the candidate form is unique up to scaling, the remaining
+                # generators must preserve it
+                a, c, b = V.gen(0)
+                Q = matrix(self._matrix_space.base_ring(), 2, [a, b, b, c])
+                return all(g.transpose() * Q * g == Q for g in gens[i:])
+            V = V.intersection(invariant_quadratic_forms(gens[i]))
             if not contains_definite_form(V):
                 return False
 
         return True
 
+    @cached_method
     def cardinality(self):
+        r"""
+        Return the number of elements of this group.
+
+        EXAMPLES::
+
+            sage: from flatsurf.geometry.finitely_generated_matrix_group import FinitelyGenerated2x2MatrixGroup
+            sage: m = matrix([[0,1],[-1,0]])
+            sage: r = matrix([[1,0],[0,-1]])
+            sage: FinitelyGenerated2x2MatrixGroup([m]).cardinality()
+            4
+            sage: G = FinitelyGenerated2x2MatrixGroup([m,r])
+            sage: G.cardinality()
+            8
+            sage: len(set(G))
+            8
+            sage: FinitelyGenerated2x2MatrixGroup([matrix([[1,1],[0,1]])]).cardinality()
+            +Infinity
+        """
         if self.is_finite():
-            # THIS IS STUPID!!!
-            return len(list(self))
+            # in a finite group the inverse of a generator is one of its
+            # powers so we do not need to multiply by inverses
+            return Integer(sum(1 for _ in self._orbit(self._generators)))
         else:
             return Infinity
 
     def __iter__(self):
-        yield self.one()
-        s = set([self.one()])
-        wait = self._generators[:]
-        while wait:
-            p = wait.pop(0)
-            if p not in s:
-                yield p
-                s.add(p)
-            for g in self._generators:
-                for m in [p*g, p*g.inverse(), g*p, g.inverse()*p]:
+        r"""
+        Iterate through the elements of this group.
+
+        The elements are enumerated breadth-first along the Schreier tree
+        rooted at the identity, i.e. by increasing word length in the
+        generators and their inverses.
+
+        EXAMPLES::
+
+            sage: from flatsurf.geometry.finitely_generated_matrix_group import FinitelyGenerated2x2MatrixGroup
+            sage: m = matrix([[0,1],[-1,0]])
+            sage: G = FinitelyGenerated2x2MatrixGroup([m])
+            sage: elements = list(G)
+            sage: elements
+            [
+            [1 0]  [ 0  1]  [ 0 -1]  [-1  0]
+            [0 1], [-1  0], [ 1  0], [ 0 -1]
+            ]
+
+        The order does not depend on whether the group was counted before::
+
+            sage: G.cardinality()
+            4
+            sage: list(G) == elements
+            True
+        """
+        gens = []
+        for g in self._generators:
+            gi = ~g
+            gi.set_immutable()
+            gens.append(g)
+            gens.append(gi)
+
+        for m in self._orbit(gens):
+            yield m
+
+    def _orbit(self, gens):
+        r"""
+        Iterate breadth-first through the products of the identity with the
+        matrices ``gens`` acting on the right.
+
+        Each element is yielded once, when the Schreier tree first reaches
+        it.
+        """
+        one = self._one
+        yield one
+
+        # we keep track of the entries rather than of the matrices since
+        # tuples are much cheaper to hash and compare
+        seen = set([tuple(one.list())])
+        frontier = deque([one])
+        while frontier:
+            p = frontier.popleft()
+            for g in gens:
+                m = p*g
+                key = tuple(m.list())
+                if key not in seen:
                     m.set_immutable()
-                    if m not in s:
-                        yield m
-                        s.add(m)
-                        wait.append(m)
+                    yield m
+                    seen.add(key)
+                    frontier.append(m)
 
     def __eq__(self, other):
+        r"""
+        Two groups are equal if they are given by the same list of generators.
+
+        EXAMPLES::
+
+            sage: from flatsurf.geometry.finitely_generated_matrix_group import FinitelyGenerated2x2MatrixGroup
+            sage: m1 = matrix([[1,1],[0,1]])
+            sage: m2 = matrix([[1,0],[1,1]])
+            sage: G = FinitelyGenerated2x2MatrixGroup([m1,m2])
+            sage: G == FinitelyGenerated2x2MatrixGroup([m1,m2])
+            True
+            sage: G == FinitelyGenerated2x2MatrixGroup([m1])
+            False
+            sage: G != FinitelyGenerated2x2MatrixGroup([m2,m1])
+            True
+        """
         return (isinstance(other, FinitelyGenerated2x2MatrixGroup) and
-                self._generators == other._generators)
+                self._fingerprint == other._fingerprint)
 
     def some_elements(self):
-        from itertools import islice
+        r"""
+        Return some elements of this group.
+
+        EXAMPLES::
+
+            sage: from flatsurf.geometry.finitely_generated_matrix_group import FinitelyGenerated2x2MatrixGroup
+            sage: m1 = matrix([[1,1],[0,1]])
+            sage: m2 = matrix([[1,0],[1,1]])
+            sage: FinitelyGenerated2x2MatrixGroup([m1,m2]).some_elements()
+            [
+            [1 0]  [1 1]  [ 1 -1]  [1 0]  [ 1  0]
+            [0 1], [0 1], [ 0  1], [1 1], [-1  1]
+            ]
+
+            sage: m = matrix([[0,1],[-1,0]])
+            sage: FinitelyGenerated2x2MatrixGroup([m]).some_elements()
+            [
+            [1 0]  [ 0  1]  [ 0 -1]  [-1  0]
+            [0 1], [-1  0], [ 1  0], [ 0 -1]
+            ]
+
+        With many generators, the identity and the distinct generators are
+        returned::
+
+            sage: FinitelyGenerated2x2MatrixGroup([m1,m2,m1,-identity_matrix(2)]).some_elements()
+            [
+            [1 0]  [1 1]  [1 0]  [-1  0]
+            [0 1], [0 1], [1 1], [ 0 -1]
+            ]
+        """
+        if len(self._generators) >= 4:
+            # the identity and the generators are enough, no need to
+            # multiply matrices
+            elements = [self._one]
+            keys = set([tuple(self._one.list())])
+            for g in self._generators[:4]:
+                key = tuple(g.list())
+                if key not in keys:
+                    keys.add(key)
+                    elements.append(g)
+            return elements
         return list(islice(self, 5))
 
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash(self._fingerprint)
+
     def __reduce__(self):
         return FinitelyGenerated2x2MatrixGroup, (self._generators, self._matrix_space)
 
     def one(self):
-        return self._matrix_space.identity_matrix()
+        return self._one
 
     def an_element(self):
         return self._generators[0]